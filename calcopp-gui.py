@@ -12,15 +12,20 @@ CalcOPP-GUI uses the module PySimpleGUI by MikeTheWatchGuy distributed under the
  LGPL-3.0.txt).
 """
 
+from collections import deque
+from functools import lru_cache
+import math
 import os
+import re
+import shutil
 import subprocess as sp
 from traceback import format_exc
-from urllib.parse import quote, urlencode
+from urllib.parse import quote
 import sys
+from threading import Event, Thread
 from webbrowser import open as web_open
 import PySimpleGUI as sg
 import annotations as an
-import sd2opp
 
 
 __author__ = 'Dennis Wiedemann'
@@ -32,21 +37,111 @@ __maintainer__ = 'Dennis Wiedemann'
 __email__ = 'dennis.wiedemann@chem.tu-berlin.de'
 __status__ = 'Production'
 
+# ===== Paths of Bundled Files and Executables ===== #
+EXECUTABLE_SUFFIX = '.exe' if sys.platform == 'win32' else ''  # Real file names as built by build.cmd/build.sh
+PDF2OPP_2D = os.path.join('.', 'pdf2opp_2d' + EXECUTABLE_SUFFIX)
+PDF2OPP_3D = os.path.join('.', 'pdf2opp_3d' + EXECUTABLE_SUFFIX)
+DOCUMENTS = {'Readme': os.path.join('docs', 'README.html'), 'Changelog': os.path.join('docs', 'CHANGELOG.html')}
+CITATION_RIS = os.path.join('data', 'citation.ris')
+CITATION_BIB = os.path.join('data', 'citation.bib')
+ICON = os.path.join('data', 'CalcOPP.ico')
+LOGO = os.path.join('data', 'logo.png')
 
-def file_exists(file):
+# ===== Pattern of Decimals Convertible by `float` (without ``inf`` and ``nan``, may still overflow to ``inf``) ===== #
+DECIMAL = re.compile(r'\s*[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?\s*')
+
+
+@lru_cache(maxsize=16)
+def directory_files(directory, modified):
+    """List the files in a directory with a single directory enumeration.
+
+    Parameters
+    ----------
+    directory : str
+        The directory to enumerate.
+    modified : int
+        The modification time of the directory in nanoseconds. This argument is only used to invalidate cached
+        listings when files are added, removed, or renamed.
+
+    Returns
+    -------
+    frozenset[str]
+        The case-normalized names of all files in the directory (empty if it cannot be enumerated).
+    """
+    try:
+        with os.scandir(directory) as entries:
+            return frozenset(os.path.normcase(entry.name) for entry in entries if entry.is_file())
+    except OSError:
+        return frozenset()
+
+
+def sibling_files(file):
+    """List the files in the directory of a given file, reusing the listing as long as the directory is unchanged.
+
+    Any change of the directory (including output written next to the input by a previous run) invalidates the
+    listing, which is then enumerated anew.
+
+    Parameters
+    ----------
+    file : str
+        The file name whose directory to enumerate.
+
+    Returns
+    -------
+    directory : str
+        The enumerated directory (as contained in `file`).
+    names : frozenset[str]
+        The case-normalized names of all files in the directory (empty if it cannot be enumerated).
+    """
+    directory = os.path.dirname(file)
+    try:
+        modified = os.stat(directory or os.curdir).st_mtime_ns
+    except OSError:
+        return directory, frozenset()
+    return directory, directory_files(directory or os.curdir, modified)
+
+
+def file_exists(file, siblings=None):
     """Check if a file exists.
 
     Parameters
     ----------
     file : str
         The file name to check.
+    siblings : tuple[str, frozenset[str]], optional
+        A directory listing as returned by :func:`sibling_files`. Files in this directory are looked up in the listing
+        first; only names missing from it are queried from the file system.
 
     Returns
     -------
     bool
         True if the file exists, False if it does not.
     """
-    return os.path.isfile(file)
+    if (siblings is not None and os.path.dirname(file) == siblings[0]
+            and os.path.normcase(os.path.basename(file)) in siblings[1]):
+        return True
+    return os.path.isfile(file)  # Also for case-insensitive file systems where `os.path.normcase` does not fold case
+
+
+def same_file(file, other):
+    """Check if two file names refer to the same existing file (e.g., via different relative paths or links).
+
+    Parameters
+    ----------
+    file : str
+        The first file name.
+    other : str
+        The second file name.
+
+    Returns
+    -------
+    bool
+        True if both names refer to the same file, False if they do not or if either file does not exist.
+    """
+    try:
+        return os.path.samefile(file, other)
+    except OSError:
+        return False
 
 
 def is_float(string):
@@ -62,10 +157,7 @@ def is_float(string):
     bool
         True if the string can be converted, False if it cannot.
     """
-    try:
-        return True if float(string) != 0 else False
-    except ValueError:
-        return False
+    return DECIMAL.fullmatch(string) is not None and math.isfinite(float(string)) and float(string) != 0
 
 
 def is_pos_float(string):
@@ -81,19 +173,17 @@ def is_pos_float(string):
     bool
         True if the string can be converted, False if it cannot.
     """
-    try:
-        return True if float(string) > 0 else False
-    except ValueError:
-        return False
+    return DECIMAL.fullmatch(string) is not None and math.isfinite(float(string)) and float(string) > 0
 
 
+@lru_cache(maxsize=None)
 def sp_args():
     """Apply quirks for `subprocess.Popen` to have standard behavior in PyInstaller-frozen windows binary.
 
     Returns
     -------
-    dict[str, str or bool or None]
-        The additional arguments for `subprocess` calls.
+    dict[str, str or int or bool or dict or None]
+        The additional arguments for `subprocess` calls (computed once and shared, do not modify).
 
     """
     if sys.platform.startswith('win32'):
@@ -102,18 +192,24 @@ def sp_args():
         startup_info = sp.STARTUPINFO()
         startup_info.dwFlags |= sp.STARTF_USESHOWWINDOW
 
-        # Make Windows search the ``PATH``
-        environment = os.environ
-
     else:
         startup_info = None
-        environment = None
 
-    # Avoid ``OSError`` exception by redirecting all standard handles
-    return {'stdout': sp.PIPE, 'stdin': sp.PIPE, 'stderr': sp.PIPE, 'startupinfo': startup_info, 'env': environment,
-            'close_fds': True}
+    # Make Windows search the ``PATH`` and keep the GFortran runtime from buffering standard output in pipes
+    environment = {**os.environ, 'GFORTRAN_UNBUFFERED_PRECONNECTED': 'y'}
+
+    # Avoid ``OSError`` exception by redirecting all standard handles and read them line by line as text
+    arguments = {'stdout': sp.PIPE, 'stdin': sp.PIPE, 'stderr': sp.PIPE, 'startupinfo': startup_info,
+                 'env': environment, 'close_fds': True, 'bufsize': 1, 'encoding': 'utf-8', 'errors': 'replace'}
 
+    # Enlarge the pipe buffers (Python 3.10+, Linux only) so that chatty subroutines do not stall on full pipes
+    if sys.version_info >= (3, 10):
+        arguments['pipesize'] = 1 << 20
 
+    return arguments
+
+
+@lru_cache(maxsize=None)
 def doc_handler():
     """Return the command for opening document files with the standard application for its type (on Windows, Linux, and
      macOS).
@@ -121,7 +217,7 @@ def doc_handler():
     Returns
     -------
     str
-        The handler file name for opening documents.
+        The handler file name for opening documents (with full path if found in the ``PATH``).
 
     Raises
     ------
@@ -130,62 +226,149 @@ def doc_handler():
 
     """
     if sys.platform.startswith('win32'):
-        return 'explorer.exe'
+        handler = 'explorer.exe'
     elif sys.platform.startswith('linux'):
-        return 'xdg-open'
+        handler = 'xdg-open'
     elif sys.platform.startswith('darwin'):
-        return 'open'
+        handler = 'open'
     else:
         raise FileNotFoundError('Unknown operating system: File handler not found')
+    return shutil.which(handler) or handler
 
 
-def subroutine_error_popup(subroutine, error, message):
-    """Display a popup for errors in subroutines.
+def run_subroutine(window, command_line, subroutine, button, output, processes, closing):
+    """Run a subroutine executable and relay its output to a window as events (target of a background thread).
+
+    Each line of standard output is appended to `output` and announced by the event ``-SUBROUTINE_LINE-``, so that the
+    window can display all lines pending at once; on termination, the event ``-SUBROUTINE_DONE-`` is posted with the
+    tuple ``(subroutine, button, start_error, stderr)`` as value, where `start_error` is the `OSError` raised if the
+    executable could not be started (else None) and `stderr` is the standard error output (empty if not started).
+    Once `closing` is set, no more events are posted, since the window may already be closed.
 
     Parameters
     ----------
+    window : PySimpleGUI.Window
+        The window to post the events to.
+    command_line : list[str]
+        The executable and its arguments.
     subroutine : str
-        The name of the subroutine causing the error.
-    error : Exception or str
-        The error caused by the subroutine.
-    message : str
-        The additional error message to be displayed.
+        The name of the subroutine.
+    button : str
+        The key of the button that started the subroutine.
+    output : collections.deque[str]
+        The buffer for lines of standard output not yet displayed.
+    processes : dict[str, subprocess.Popen]
+        The running subroutine processes by button key, registered here so that they can be terminated on closing.
+    closing : threading.Event
+        The flag set when the window is about to close.
+
+    """
+    try:
+        process = sp.Popen(command_line, **sp_args())
+    except OSError as exc:  # Executable not found, not executable, or pipes not configurable
+        if not closing.is_set():
+            window.write_event_value('-SUBROUTINE_DONE-', (subroutine, button, exc, ''))
+        return
+    processes[button] = process
+    if closing.is_set():  # Window closing while the subroutine was started
+        process.terminate()
+
+    # Drain standard error concurrently so that neither pipe can fill up and block the subroutine
+    errors = []
+    with process:
+        error_reader = Thread(target=errors.extend, args=(process.stderr,), daemon=True)
+        error_reader.start()
+        for line in process.stdout:
+            output.append(line)
+            if not closing.is_set():
+                window.write_event_value('-SUBROUTINE_LINE-', None)
+        error_reader.join()
+    del processes[button]
+    if not closing.is_set():
+        window.write_event_value('-SUBROUTINE_DONE-', (subroutine, button, None, ''.join(errors)))
+
+
+@lru_cache(maxsize=None)
+def error_popup_window():
+    """Create the window for errors in subroutines once and keep it hidden for reuse.
+
+    Returns
+    -------
+    PySimpleGUI.Window
+        The finalized, hidden error window.
 
     """
-    # ===== Error Window Definition ===== #
     error_layout = [
-        [sg.Text(an.ERROR_INTRO.format(subroutine))],
-        [sg.Text(message)],
+        [sg.Text('', key='-INTRO-')],
+        [sg.Text('', key='-MESSAGE-')],
         [sg.Text(an.ERROR_OUTRO, text_color='red')],
         [sg.Text('', font='default 10 italic', key='-COPY_DONE-', size=(40, 1))],
         [sg.Button('Copy to clipboard', key='-CLIPBOARD-'),
          sg.Button('Send as e-mail', key='-EMAIL-', bind_return_key=True, focus=True),
          sg.Exit('Close', key='close')]
     ]
-    error_window = sg.Window('Subroutine Error', error_layout, modal=True)
+    error_window = sg.Window('Subroutine Error', error_layout, enable_close_attempted_event=True, finalize=True)
+    error_window.hide()
+    return error_window
+
+
+def subroutine_error_popup(subroutine, error, message):
+    """Display a popup for errors in subroutines (its events are handled by :func:`error_popup_event`).
+
+    Parameters
+    ----------
+    subroutine : str
+        The name of the subroutine causing the error.
+    error : str
+        The error caused by the subroutine.
+    message : str
+        The additional error message to be displayed.
+
+    """
+    error_window = error_popup_window()
+    error_window.metadata = (subroutine, error, message)
+    error_window['-INTRO-'](an.ERROR_INTRO.format(subroutine))
+    error_window['-MESSAGE-'](message)
+    error_window['-COPY_DONE-']('')
+    error_window.un_hide()
+    error_window.bring_to_front()
+
+
+def error_popup_event(error_window, event_error):
+    """Handle button actions in the popup for errors in subroutines.
+
+    Parameters
+    ----------
+    error_window : PySimpleGUI.Window
+        The error window as returned by :func:`error_popup_window`.
+    event_error : str
+        The event read from the error window.
+
+    """
+    if event_error in [sg.WINDOW_CLOSE_ATTEMPTED_EVENT, 'close']:
+        error_window.hide()
+        return
+    elif event_error == sg.WIN_CLOSED:
+        error_popup_window.cache_clear()
+        return
 
-    # ===== Handle Button Actions ===== #
-    while True:
-        event_error, values_error = error_window.Read()
-        if event_error in [sg.WIN_CLOSED, 'close']:
-            error_window.close()
-            break
+    subroutine, error, message = error_window.metadata
 
-        # Copy trace to clipboard
-        elif event_error == '-CLIPBOARD-':
-            sg.clipboard_set('Version: {}\n\n{}\n\n{}'.format(__version__, str(error), message))
-            error_window['-COPY_DONE-']('(Error message copied to clipboard.)')
+    # Copy trace to clipboard
+    if event_error == '-CLIPBOARD-':
+        sg.clipboard_set(f'Version: {__version__}\n\n{error}\n\n{message}')
+        error_window['-COPY_DONE-']('(Error message copied to clipboard.)')
 
-        # Compose bug report as e-mail
-        elif event_error == '-EMAIL-':
-            query = {'subject': f'Error in {subroutine}',
-                     'body': 'Version:\n{}\n\nMessage:\n{}\n\nComment:\n'.format(__version__, message)}
-            web_open(f'mailto:{__email__}?{urlencode(query, quote_via=quote)}', new=1)
+    # Compose bug report as e-mail
+    elif event_error == '-EMAIL-':
+        subject = quote(f'Error in {subroutine}', safe='')
+        body = quote(f'Version:\n{__version__}\n\nMessage:\n{message}\n\nComment:\n', safe='')
+        web_open(f'mailto:{__email__}?subject={subject}&body={body}', new=1)
 
 
 # ===== Global GUI Parameters ===== #
 sg.theme('Dark Grey 4')
-sg.set_global_icon(os.path.join('data', 'CalcOPP.ico'))
+sg.set_global_icon(ICON)
 
 # ===== Menu Definition ===== #
 menu_def = [['&File', 'E&xit'], ['&Help', ['&Readme', '&Changelog', sg.MENU_SEPARATOR_LINE, '&About …']]]
@@ -229,7 +412,9 @@ tab_pdf2d = [
         sg.Checkbox('OPP', default=True, key='2d_output_opp'),
         sg.Checkbox('OPP error', enable_events=True, key='2d_output_opp_err', pad=((5, 146), 3)),
     ]])],
-    [sg.OK('Make it so!', key='2d_okay'), sg.OK('Reset', key='2d_reset')]
+    [sg.OK('Make it so!', key='2d_okay', disabled=not os.path.isfile(PDF2OPP_2D),
+           tooltip=None if os.path.isfile(PDF2OPP_2D) else 'PDF2OPP_2D executable not found in program directory.'),
+     sg.OK('Reset', key='2d_reset')]
 ]
 
 # ----- Tab for 3D PDF Data Sources ----- #
@@ -250,7 +435,9 @@ tab_pdf3d = [
         sg.Input(size=(8, 1), disabled=True, key='3d_temp'),
         sg.Text('K', pad=((5, 152), 3))
     ]])],
-    [sg.OK('Engage!', key='3d_okay'), sg.OK('Reset', key='3d_reset')]
+    [sg.OK('Engage!', key='3d_okay', disabled=not os.path.isfile(PDF2OPP_3D),
+           tooltip=None if os.path.isfile(PDF2OPP_3D) else 'PDF2OPP_3D executable not found in program directory.'),
+     sg.OK('Reset', key='3d_reset')]
 ]
 
 # ----- Tab for Scatterer-Density Data Source ----- #
@@ -280,56 +467,106 @@ tab_sd = [
 ]
 
 # ----- Assembly of Right Column ----- #
+# Only the initial tab is realized on startup, the others are filled on first selection
+tab_pdf3d_stub = sg.Tab('3D PDF', [[sg.Text('Loading …', key='3d_placeholder')]])
+tab_sd_stub = sg.Tab('Scatterer Density', [[sg.Text('Loading …', key='sd_placeholder')]])
+tabs_pending = {'3D PDF': (tab_pdf3d_stub, tab_pdf3d, '3d_placeholder'),
+                'Scatterer Density': (tab_sd_stub, tab_sd, 'sd_placeholder')}
+
 column_right = [
-    [sg.TabGroup([[sg.Tab('2D PDF', tab_pdf2d), sg.Tab('3D PDF', tab_pdf3d), sg.Tab('Scatterer Density', tab_sd)]],
-                 enable_events=True, key='data_source')],
+    [sg.TabGroup([[sg.Tab('2D PDF', tab_pdf2d), tab_pdf3d_stub, tab_sd_stub]], enable_events=True, key='data_source')],
     [sg.Frame('Output', [[sg.Multiline(size=(77, 12), font='Courier 9', key='output', autoscroll=True, write_only=True,
                                        auto_refresh=True, reroute_stderr=True, reroute_stdout=True, disabled=True)]])]
 ]
 
+# ----- Input Fields Enabled by Radio Buttons for Custom Values (by Tab Prefix) ----- #
+custom_fields = {'2d': ('2d_temp', '2d_temp_source_custom'),
+                 '3d': ('3d_temp', '3d_temp_source_custom'),
+                 'sd': ('sd_extremum', 'sd_extremum_source_custom')}
+
+# ----- Element States Restored by Reset Buttons (by Tab Prefix) ----- #
+reset_values = {
+    '2d': {'2d_file_in': {'value': ''},
+           '2d_file_err': {'value': '', 'disabled': True},
+           '2d_file_err_button': {'disabled': True},
+           '2d_file_out': {'value': ''},
+           '2d_temp_source_m90': {'value': True},
+           '2d_temp': {'value': '', 'disabled': True},
+           '2d_output_pdf': {'value': False},
+           '2d_output_pdf_err': {'value': False},
+           '2d_output_opp': {'value': True},
+           '2d_output_opp_err': {'value': False}},
+    '3d': {'3d_file_in': {'value': ''},
+           '3d_file_out': {'value': ''},
+           '3d_temp_source_m90': {'value': True},
+           '3d_temp': {'value': '', 'disabled': True}},
+    'sd': {'sd_file_in': {'value': ''},
+           'sd_file_out': {'value': ''},
+           'sd_temp': {'value': ''},
+           'sd_extremum_source_minimum': {'value': True},
+           'sd_extremum': {'value': '', 'disabled': True}}
+}
+
+# ----- Command-Line Flags of PDF2OPP_2D Set by Output Checkboxes ----- #
+output_flags_pdf2d = {'2d_output_pdf': '-pdf', '2d_output_pdf_err': '-pdferr', '2d_output_opp': '-opp',
+                      '2d_output_opp_err': '-opperr'}
+
+# ----- Manual Sections Split into Text and Style (by Tab Title) ----- #
+manuals = {tab: [(section['text'], {key: value for key, value in section.items() if key != 'text'})
+                 for section in manual]
+           for tab, manual in (('2D PDF', an.MANUAL_PDF2D), ('3D PDF', an.MANUAL_PDF3D),
+                               ('Scatterer Density', an.MANUAL_SD))}
+manual_shown = None
+
+# ===== Buffer for Output of Subroutines Running in Background ===== #
+subroutine_output = deque()
+
+# ===== Processes and Threads of Subroutines Running in Background (by Button Key) ===== #
+subroutine_processes = {}
+subroutine_threads = {}
+window_closing = Event()
+
 # ===== Window Invocation ===== #
 layout_main = [[sg.Menu(menu_def), sg.Column(column_left), sg.Column(column_right)]]
 window_main = sg.Window('CalcOPP – Calculation of One-Particle Potentials', layout_main, default_element_size=(40, 1))
 
-# ===== Event Loop for Persistent Window (Main Program) ===== #
+# ===== Event Loop for Persistent Windows (Main Program and Error Popup) ===== #
 while True:
-    event_main, values_main = window_main.read()
+    window_event, event_main, values_main = sg.read_all_windows()
+    if window_event is not window_main:
+        error_popup_event(window_event, event_main)
+        continue
     if event_main in [sg.WIN_CLOSED, 'Exit']:
+        # ----- Stop Subroutines Running in Background ----- #
+        window_closing.set()
+        for process in list(subroutine_processes.values()):
+            process.terminate()
+        for thread in subroutine_threads.values():
+            thread.join()
         window_main.close()
         break
 
     # ----- Toggle Explanations According to Tab ----- #
     if event_main == 'data_source':
-        if values_main['data_source'] == '2D PDF':
-            manual = an.MANUAL_PDF2D
-        elif values_main['data_source'] == '3D PDF':
-            manual = an.MANUAL_PDF3D
-        else:
-            manual = an.MANUAL_SD
-        window_main['manual']('')
-        for section in manual:
-            kwargs = section.copy()
-            text = kwargs.pop('text')
-            sg.cprint(text, **kwargs, autoscroll=False)
-        window_main['manual'](disabled=True)
-
-    # ----- Toggle Custom Temperature/Extremum Fields ----- #
-    elif '_source_' in event_main:
 
-        if values_main['2d_temp_source_custom']:
-            window_main['2d_temp'](disabled=False)
-        else:
-            window_main['2d_temp'](disabled=True)
+        # ····· Realize Tab on First Selection ····· #
+        if values_main['data_source'] in tabs_pending:
+            tab_stub, tab_layout, tab_placeholder = tabs_pending.pop(values_main['data_source'])
+            window_main[tab_placeholder].hide_row()
+            window_main.extend_layout(tab_stub, tab_layout)
 
-        if values_main['3d_temp_source_custom']:
-            window_main['3d_temp'](disabled=False)
-        else:
-            window_main['3d_temp'](disabled=True)
+        # ····· Render Manual Unless Already Displayed ····· #
+        if values_main['data_source'] != manual_shown:
+            manual_shown = values_main['data_source']
+            window_main['manual']('')
+            for text, style in manuals[manual_shown]:
+                sg.cprint(text, **style, autoscroll=False)
+            window_main['manual'](disabled=True)
 
-        if values_main['sd_extremum_source_custom']:
-            window_main['sd_extremum'](disabled=False)
-        else:
-            window_main['sd_extremum'](disabled=True)
+    # ----- Toggle Custom Temperature/Extremum Fields ----- #
+    elif '_source_' in event_main:
+        custom_field, custom_radio = custom_fields[event_main[:2]]
+        window_main[custom_field](disabled=not values_main[custom_radio])
 
     # ----- Toggle Error Processing for 2D PDF ----- #
     elif event_main.startswith('2d_output'):
@@ -342,50 +579,20 @@ while True:
 
     # ----- Empty Tab on Reset Button ----- #
     elif event_main.endswith('reset'):
-
-        # ····· Empty 2D PDF Tab on Reset Button ····· #
-        if event_main == '2d_reset':
-            window_main['2d_file_in']('')
-            window_main['2d_file_err']('')
-            window_main['2d_file_out']('')
-            window_main['2d_temp_source_m90'](True)
-            window_main['2d_temp']('', disabled=True)
-            window_main['2d_output_pdf'](False)
-            window_main['2d_output_pdf_err'](False)
-            window_main['2d_output_opp'](True)
-            window_main['2d_output_opp_err'](False)
-            window_main['manual'](an.MANUAL_PDF2D)
-            window_main['output']('')
-
-        # ····· Empty 3D PDF Tab on Reset Button ····· #
-        elif event_main == '3d_reset':
-            window_main['3d_file_in']('')
-            window_main['3d_file_out']('')
-            window_main['3d_temp_source_m90'](True)
-            window_main['3d_temp']('', disabled=True)
-            window_main['manual'](an.MANUAL_PDF3D)
-            window_main['output']('')
-
-        # ····· Empty Scatterer Density Tab on Reset Button ····· #
-        else:
-            window_main['sd_file_in']('')
-            window_main['sd_file_out']('')
-            window_main['sd_temp']('')
-            window_main['sd_extremum_source_minimum'](True)
-            window_main['sd_extremum']('', disabled=True)
-            window_main['manual'](an.MANUAL_SD)
-            window_main['output']('')
+        for key, update in reset_values[event_main[:2]].items():
+            window_main[key](**update)
+        window_main['output']('')
 
     # ----- Open README or CHANGELOG ----- #
     elif event_main in ['Readme', 'Changelog']:
-        sp.run([doc_handler(), os.path.join('docs', f'{event_main.upper()}.html')], **sp_args())
+        sp.run([doc_handler(), DOCUMENTS[event_main]], **sp_args())
 
     # ----- Open "About" Window ----- #
     elif event_main == 'About …':
 
         # ····· "About" Window Definition ····· #  (keep in the same control structure as call to not retain state)
         layout_about = [
-            [sg.Image(os.path.join('data', 'logo.png'))],
+            [sg.Image(LOGO)],
             [sg.Text('\nCalcOPP – Calculation of One-Particle Potentials', font='default 18')],
             [sg.Text('Version {}\n'.format(__version__), font='default 14')],
             [sg.Text(an.CITATION)],
@@ -394,8 +601,8 @@ while True:
              sg.Radio('BibTeX format', 'FORMAT', key='-FORMAT_BIB-'),
              sg.OK('Export', key='-CITATION_EXPORT-')],
             [sg.Text(' ')],
-            *[[sg.Text(link, font='default 10 underline', key=f'-LINK_{an.LINKS.index(link)}-', enable_events=True)]
-              for link in an.LINKS],
+            *[[sg.Text(link, font='default 10 underline', key=f'-LINK_{index}-', enable_events=True)]
+              for index, link in enumerate(an.LINKS)],
             [sg.Text('\n' + an.LICENSE)],
             [sg.Exit('Done')]
         ]
@@ -410,76 +617,105 @@ while True:
                 break
             elif event_about == '-CITATION_EXPORT-':
                 if values_about['-FORMAT_RIS-']:
-                    sp.run([doc_handler(), os.path.join('data', 'citation.ris')], **sp_args())
+                    sp.run([doc_handler(), CITATION_RIS], **sp_args())
                 else:
-                    sp.run([doc_handler(), os.path.join('data', 'citation.bib')], **sp_args())
+                    sp.run([doc_handler(), CITATION_BIB], **sp_args())
             elif event_about.startswith('-LINK_'):
                 web_open(an.LINKS[int(event_about.removeprefix('-LINK_').removesuffix('-'))], new=1)
 
+    # ----- Display Output of Subroutine Running in Background ----- #
+    elif event_main == '-SUBROUTINE_LINE-':
+        if subroutine_output:
+            lines = [subroutine_output.popleft() for _ in range(len(subroutine_output))]
+            window_main['output'].update(''.join(lines), append=True)
+
+    # ----- Finish Subroutine Running in Background ----- #
+    elif event_main == '-SUBROUTINE_DONE-':
+        subroutine, button, start_error, error_message = values_main[event_main]
+
+        # ····· Show Popup on Error ····· #
+        if isinstance(start_error, FileNotFoundError):
+            sg.popup_error(f'{subroutine} executable not found in program directory.', title='Program Error')
+        elif start_error is not None:
+            sg.popup_error(f'{subroutine} could not be started:\n{start_error}', title='Program Error')
+        else:
+            print(error_message)
+            if error_message.startswith('ERROR STOP '):
+                subroutine_error_popup(subroutine, 'ERROR STOP', error_message[11:])
+            elif error_message:
+                subroutine_error_popup(subroutine, 'Unknown error', error_message)
+
+        window_main[button](disabled=False)
+
     # ----- Start Calculations ----- #
     else:
 
         # ····· Check 2D PDF Input Values for Errors ····· #
-        error_message = ''
+        errors = []
         if event_main == '2d_okay':
+            siblings = sibling_files(values_main['2d_file_in']) if values_main['2d_file_in'] else None
             if not values_main['2d_file_in']:
-                error_message += '\nNo input file is given.'
-            elif not file_exists(values_main['2d_file_in']):
-                error_message += '\nInput file does not exist.'
+                errors.append('No input file is given.')
+            elif not file_exists(values_main['2d_file_in'], siblings):
+                errors.append('Input file does not exist.')
             if values_main['2d_output_opp_err'] or values_main['2d_output_pdf_err']:
                 if not values_main['2d_file_err']:
-                    error_message += '\nNo error file is given.'
-                elif not file_exists(values_main['2d_file_err']):
-                    error_message += '\nError file does not exist.'
+                    errors.append('No error file is given.')
+                elif not file_exists(values_main['2d_file_err'], siblings):
+                    errors.append('Error file does not exist.')
                 if values_main['2d_file_err'] == values_main['2d_file_in'] and values_main['2d_file_in']:
-                    error_message += '\nInput and error file are the same.'
+                    errors.append('Input and error file are the same.')
                 if values_main['2d_file_out'] == values_main['2d_file_err'] and values_main['2d_file_out']:
-                    error_message += '\nError and output file are the same.'
+                    errors.append('Error and output file are the same.')
             if not values_main['2d_file_out']:
-                error_message += '\nNo output file is given.'
+                errors.append('No output file is given.')
             elif values_main['2d_file_out'] == values_main['2d_file_in']:
-                error_message += '\nInput and output file are the same.'
-            if values_main['2d_temp_source_m90'] and not file_exists(values_main['2d_file_in'][:-4] + '.m90'):
-                error_message += '\nFile *.m90 does not exist in the same directory.'
+                errors.append('Input and output file are the same.')
+            if values_main['2d_temp_source_m90'] and siblings is not None and not file_exists(
+                    os.path.splitext(values_main['2d_file_in'])[0] + '.m90', siblings):
+                errors.append('File *.m90 does not exist in the same directory.')
             if values_main['2d_temp_source_custom'] and not is_pos_float(values_main['2d_temp']):
-                error_message += '\nTemperature must be a positive decimal.'
+                errors.append('Temperature must be a positive decimal.')
             if not (values_main['2d_output_opp'] or values_main['2d_output_pdf']
                     or values_main['2d_output_opp_err'] or values_main['2d_output_pdf_err']):
-                error_message += '\nNo data to include in output selected.'
+                errors.append('No data to include in output selected.')
 
         # ····· Check 3D PDF Input Values for Errors ····· #
         elif event_main == '3d_okay':
+            siblings = sibling_files(values_main['3d_file_in']) if values_main['3d_file_in'] else None
             if not values_main['3d_file_in']:
-                error_message += '\nNo input file is given.'
-            elif not file_exists(values_main['3d_file_in']):
-                error_message += '\nInput file does not exist.'
+                errors.append('No input file is given.')
+            elif not file_exists(values_main['3d_file_in'], siblings):
+                errors.append('Input file does not exist.')
             if not values_main['3d_file_out']:
-                error_message += '\nNo output file is given.'
+                errors.append('No output file is given.')
             elif values_main['3d_file_out'] == values_main['3d_file_in']:
-                error_message += '\nInput and output file are the same.'
-            if values_main['3d_temp_source_m90'] and not file_exists(values_main['3d_file_in'][:-8] + '.m90'):
-                error_message += '\nFile *.m90 does not exist in the same directory.'
+                errors.append('Input and output file are the same.')
+            if values_main['3d_temp_source_m90'] and siblings is not None and not file_exists(
+                    os.path.splitext(values_main['3d_file_in'])[0].removesuffix('_tmp') + '.m90', siblings):
+                errors.append('File *.m90 does not exist in the same directory.')
             if values_main['3d_temp_source_custom'] and not is_pos_float(values_main['3d_temp']):
-                error_message += '\nTemperature must be a positive decimal.'
+                errors.append('Temperature must be a positive decimal.')
 
         # ····· Check Scatterer Density Input Values for Errors ····· #
         elif event_main == 'sd_okay':
             if not values_main['sd_file_in']:
-                error_message += '\nNo input file is given.'
+                errors.append('No input file is given.')
             elif not file_exists(values_main['sd_file_in']):
-                error_message += '\nInput file does not exist.'
+                errors.append('Input file does not exist.')
             if not values_main['sd_file_out']:
-                error_message += '\nNo output file is given.'
-            elif values_main['sd_file_out'] == values_main['sd_file_in']:
-                error_message += '\nInput and output file are the same.'
+                errors.append('No output file is given.')
+            elif values_main['sd_file_out'] == values_main['sd_file_in'] or same_file(values_main['sd_file_in'],
+                                                                                     values_main['sd_file_out']):
+                errors.append('Input and output file are the same.')
             if not is_pos_float(values_main['sd_temp']):
-                error_message += '\nTemperature must be a positive decimal.'
+                errors.append('Temperature must be a positive decimal.')
             if values_main['sd_extremum_source_custom'] and not is_float(values_main['sd_extremum']):
-                error_message += '\nExtremal value must be a decimal.'
+                errors.append('Extremal value must be a decimal.')
 
-        if error_message:
+        if errors:
             # ····· Display Error Message ····· #
-            sg.popup_error(error_message[1:] + '\n', title='Error')
+            sg.popup_error('\n'.join(errors) + '\n', title='Error')
 
         else:
 
@@ -487,77 +723,34 @@ while True:
             if event_main == '2d_okay':
 
                 #       Assemble Command Line       #
-                command_line = [os.path.join('.', 'pdf2opp_2d')]
-                command_line.extend(['-i', values_main['2d_file_in']])
-                command_line.extend(['-o', values_main['2d_file_out']])
-                if values_main['2d_output_opp_err'] or values_main['2d_output_pdf_err']:
-                    command_line.extend(['-e', values_main['2d_file_err']])
-                if values_main['2d_temp_source_custom']:
-                    command_line.extend(['-t', values_main['2d_temp']])
-                if values_main['2d_output_pdf']:
-                    command_line.append('-pdf')
-                if values_main['2d_output_pdf_err']:
-                    command_line.append('-pdferr')
-                if values_main['2d_output_opp']:
-                    command_line.append('-opp')
-                if values_main['2d_output_opp_err']:
-                    command_line.append('-opperr')
+                command_line = [PDF2OPP_2D, '-i', values_main['2d_file_in'], '-o', values_main['2d_file_out'],
+                                *(('-e', values_main['2d_file_err'])
+                                  if values_main['2d_output_opp_err'] or values_main['2d_output_pdf_err'] else ()),
+                                *(('-t', values_main['2d_temp']) if values_main['2d_temp_source_custom'] else ()),
+                                *(flag for key, flag in output_flags_pdf2d.items() if values_main[key])]
 
+                #       Execute Command in Background       #
                 window_main['2d_okay'](disabled=True)
-
-                try:
-                    #       Execute Command       #
-                    pdf2opp = sp.Popen(command_line, text=True, **sp_args())
-                    for line in pdf2opp.stdout:
-                        print(line.rstrip())
-                        window_main.refresh()
-
-                    #       Show Popup on Error       #
-                    _, error_message = pdf2opp.communicate()
-                    print(error_message)
-                    if error_message.startswith('ERROR STOP '):
-                        subroutine_error_popup('PDF2OPP_2D', 'ERROR STOP', error_message[11:])
-                    elif error_message:
-                        subroutine_error_popup('PDF2OPP_2D', 'Unknown error', error_message)
-
-                except FileNotFoundError:
-                    error_message = 'PDF2OPP_2D executable not found in program directory.'
-                    sg.popup_error(error_message, title='Program Error')
-
-                window_main['2d_okay'](disabled=False)
+                subroutine_threads['2d_okay'] = Thread(target=run_subroutine,
+                                                      args=(window_main, command_line, 'PDF2OPP_2D', '2d_okay',
+                                                            subroutine_output, subroutine_processes, window_closing),
+                                                      daemon=True)
+                subroutine_threads['2d_okay'].start()
 
             # ····· Spawn 3D OPP Calculation Routine ····· #
             elif event_main == '3d_okay':
 
                 #       Assemble Command Line       #
-                command_line = [os.path.join('.', 'pdf2opp_3d')]
-                command_line.extend(['-i', values_main['3d_file_in']])
-                command_line.extend(['-o', values_main['3d_file_out']])
-                if values_main['3d_temp_source_custom']:
-                    command_line.extend(['-t', values_main['3d_temp']])
+                command_line = [PDF2OPP_3D, '-i', values_main['3d_file_in'], '-o', values_main['3d_file_out'],
+                                *(('-t', values_main['3d_temp']) if values_main['3d_temp_source_custom'] else ())]
 
+                #       Execute Command in Background       #
                 window_main['3d_okay'](disabled=True)
-
-                try:
-                    #       Execute Command       #
-                    pdf3opp = sp.Popen(command_line, text=True, **sp_args())
-                    for line in pdf3opp.stdout:
-                        print(line.rstrip())
-                        window_main.refresh()
-
-                    #       Show Popup on Error       #
-                    _, error_message = pdf3opp.communicate()
-                    print(error_message)
-                    if error_message.startswith('ERROR STOP '):
-                        subroutine_error_popup('PDF2OPP_3D', 'ERROR STOP', error_message[11:])
-                    elif error_message:
-                        subroutine_error_popup('PDF2OPP_3D', 'Unknown error', error_message)
-
-                except FileNotFoundError:
-                    error_message = 'PDF2OPP_3D executable not found in program directory.'
-                    sg.popup_error(error_message, title='Program Error')
-
-                window_main['3d_okay'](disabled=False)
+                subroutine_threads['3d_okay'] = Thread(target=run_subroutine,
+                                                      args=(window_main, command_line, 'PDF2OPP_3D', '3d_okay',
+                                                            subroutine_output, subroutine_processes, window_closing),
+                                                      daemon=True)
+                subroutine_threads['3d_okay'].start()
 
             # ····· Call OPP Calculation from Scatterer Density ····· #
             elif event_main == 'sd_okay':
@@ -573,11 +766,12 @@ while True:
                     source = 'custom'
 
                 try:
-                    #       Call Calculation Routine       #
+                    #       Call Calculation Routine (NumPy imported only on first use)       #
+                    import sd2opp
                     sd2opp.calc_opp(values_main['sd_file_in'], values_main['sd_file_out'],
                                     float(values_main['sd_temp']), source,
                                     float(values_main['sd_extremum']) if source == 'custom' else None)
-                except Exception as exc:
-                    subroutine_error_popup('SD2OPP', exc, format_exc())
+                except Exception as exc:  # Keep only text, traceback frames would keep the input file mapped
+                    subroutine_error_popup('SD2OPP', str(exc), format_exc())
 
                 window_main['sd_okay'](disabled=False)
@@ -21,12 +21,21 @@ __email__ = 'dennis.wiedemann@chem.tu-berlin.de'
 __status__ = 'Production'
 
 import argparse as ap
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
 import os
 import sys
 import numpy as np
 
 K_B = 1.380649e-23 / 1.602176634e-19  # Boltzmann constant in eV/K (according to CODATA 2018)
 
+# ===== Layout of Grid-File Headers (Fixed Part and Counts of Indexed Files, see :func:`write_grid`) ===== #
+HEADER = np.dtype([('version', '4i4'), ('title', 'S80'), ('gtype', 'i4'), ('ftype', 'i4'), ('nval', 'i4'),
+                   ('ndim', 'i4'), ('ngrid', '3i4'), ('nasym', 'i4'), ('cell', '6f4')])
+HEADER_INDEXED = np.dtype([('npos', 'i4'), ('ncen', 'i4'), ('nsub', 'i4')])
+
+BLOCK = 1 << 18  # Number of voxels processed at once (1 MiB of float32 values, fits into L2 cache)
+
 
 def non_zero_float(string):
     """Define non-zero floats for `argparse`.
@@ -83,6 +92,59 @@ def pos_float(string):
     return value
 
 
+def input_path(string):
+    """Define paths of existing, readable files for `argparse`.
+
+    Parameters
+    ----------
+    string : str
+        The path to check.
+
+    Returns
+    -------
+    str
+        The unchanged path.
+
+    Raises
+    ------
+    argparse.ArgumentTypeError
+        If string is not the path of an existing, readable file.
+    """
+    if not os.path.isfile(string):
+        raise ap.ArgumentTypeError(f'"{string}" is not an existing file.')
+    if not os.access(string, os.R_OK):
+        raise ap.ArgumentTypeError(f'Cannot read "{string}".')
+    return string
+
+
+def output_path(string):
+    """Define paths of writable files for `argparse`.
+
+    Parameters
+    ----------
+    string : str
+        The path to check.
+
+    Returns
+    -------
+    str
+        The unchanged path.
+
+    Raises
+    ------
+    argparse.ArgumentTypeError
+        If string is the path of a directory, of an existing non-writable file, or of a file in a non-writable or
+        non-existing directory.
+    """
+    if os.path.isdir(string):
+        raise ap.ArgumentTypeError(f'"{string}" is a directory.')
+    if os.path.exists(string) and not os.access(string, os.W_OK):
+        raise ap.ArgumentTypeError(f'Cannot write to "{string}".')
+    if not os.access(os.path.dirname(string) or os.curdir, os.W_OK):
+        raise ap.ArgumentTypeError(f'Cannot write to directory of "{string}".')
+    return string
+
+
 def multibyte_truncate(string, byte_length, encoding='utf-8'):
     """Truncate a multi-byte encoded string to a given maximal byte size.
 
@@ -100,8 +162,14 @@ def multibyte_truncate(string, byte_length, encoding='utf-8'):
     str
         The truncated string.
     """
-    encoded = string.encode(encoding)[:byte_length]
-    return encoded.decode(encoding, 'ignore')
+    encoded = string.encode(encoding)
+    if len(encoded) <= byte_length:
+        return string  # Nothing to truncate
+    if encoding.lower().replace('_', '-') in ('utf-8', 'utf8'):
+        while byte_length > 0 and encoded[byte_length] & 0xC0 == 0x80:  # Step back to start byte of character
+            byte_length -= 1
+        return encoded[:byte_length].decode(encoding)
+    return encoded[:byte_length].decode(encoding, 'ignore')
 
 
 def hello():
@@ -141,72 +209,75 @@ def read_grid(file):
     write_grid : Write binary grid-files.
 
     """
-    with open(file, 'rb') as read_file:
-
-        # ----- Read and check header values ----- #
-        header = {'version': np.fromfile(read_file, dtype=np.dtype('4i4'), count=1)[0]}
-        if (header['version'] != [3, 0, 0, 0]).any():
-            print('Input file version not supported.\nTrying to read anyway ... ', end='')
-        title_raw = read_file.read(80)
-        header['title'] = title_raw[:title_raw.find(b'\x00')].decode(encoding='utf-8', errors='replace')
-        header['gtype'] = np.fromfile(read_file, dtype=np.int32, count=1)[0]
-        header['ftype'] = np.fromfile(read_file, dtype=np.int32, count=1)[0]
-        if header['ftype'] not in [0, 1]:
-            print('Failed.')
-            sys.exit('File record type not supported.')
-        header['nval'] = np.fromfile(read_file, dtype=np.int32, count=1)[0]
-        if header['nval'] not in [1, 2]:
-            print('Failed.')
-            sys.exit('Unable to handle number of values per voxel.')
-        header['ndim'] = np.fromfile(read_file, dtype=np.int32, count=1)[0]
-        if header['ndim'] != 3:
-            print('Failed.')
-            sys.exit('Unit cell must be three-dimensional in this version.')
-        header['ngrid'] = np.fromfile(read_file, dtype=np.dtype('3i4'), count=1)[0]
-        header['nasym'] = np.fromfile(read_file, dtype=np.int32, count=1)[0]
-        header['cell'] = np.fromfile(read_file, dtype=np.dtype('6f4'), count=1)[0]
-
-        if header['ftype'] == 1:
-
-            # ----- Read remaining header values and data for indexed (symmetry-dependent) file ----- #
-            header['npos'] = np.fromfile(read_file, dtype=np.int32, count=1)[0]
-            header['ncen'] = np.fromfile(read_file, dtype=np.int32, count=1)[0]
-            header['nsub'] = np.fromfile(read_file, dtype=np.int32, count=1)[0]
-            header['symop'] = np.fromfile(read_file, dtype=np.dtype('12i4'), count=header['npos'])
-            header['subposp'] = np.fromfile(read_file, dtype=np.dtype('3i4'), count=1)[0]
-
-            if header['nval'] == 2:
-                data_raw = np.fromfile(read_file, dtype=[('index', 'i4'), ('pos_value', 'f4'), ('neg_value', 'f4')])
-                if data_raw.size != header['nasym']:
-                    print('Number of found records differs from statement in header.\nContinuing with found data ...')
-                indices = data_raw['index']
-                data = data_raw['pos_value'] + data_raw['neg_value']
-            else:
-                data_raw = np.fromfile(read_file, dtype=[('index', 'i4'), ('value', 'f4')])
-                if data_raw.size != header['nasym']:
-                    print('Number of found records differs from statement in header.\nContinuing with found data ...')
-                indices = data_raw['index']
-                data = data_raw['value']
-
+    buffer = np.memmap(file, dtype=np.uint8, mode='c')  # Map file copy-on-write, pages are read on demand
+    offset = 0
+
+    def take(dtype, count=1):
+        """Take `count` items of `dtype` (all remaining complete ones if negative) from buffer and advance offset."""
+        nonlocal offset
+        dtype = np.dtype(dtype)
+        if count < 0:
+            count = (len(buffer) - offset) // dtype.itemsize
+        items = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+        offset += items.nbytes
+        return items
+
+    # ----- Read and check header values ----- #
+    header_raw = take(HEADER)[0]
+    header = {name: header_raw[name] for name in HEADER.names}
+    if (header['version'] != [3, 0, 0, 0]).any():
+        print('Input file version not supported.\nTrying to read anyway ... ', end='')
+    header['title'] = header['title'].split(b'\x00', 1)[0].decode(encoding='utf-8', errors='replace')
+    if header['ftype'] not in [0, 1]:
+        print('Failed.')
+        sys.exit('File record type not supported.')
+    if header['nval'] not in [1, 2]:
+        print('Failed.')
+        sys.exit('Unable to handle number of values per voxel.')
+    if header['ndim'] != 3:
+        print('Failed.')
+        sys.exit('Unit cell must be three-dimensional in this version.')
+
+    if header['ftype'] == 1:
+
+        # ----- Read remaining header values and data for indexed (symmetry-dependent) file ----- #
+        header_raw = take(HEADER_INDEXED)[0]
+        header.update((name, header_raw[name]) for name in HEADER_INDEXED.names)
+        header['symop'] = take(np.dtype('12i4'), header['npos'])
+        header['subposp'] = take(np.dtype('3i4'))[0]
+
+        if header['nval'] == 2:
+            data_raw = take([('index', 'i4'), ('pos_value', 'f4'), ('neg_value', 'f4')], -1)
+            if data_raw.size != header['nasym']:
+                print('Number of found records differs from statement in header.\nContinuing with found data ...')
+            indices = data_raw['index']
+            data = data_raw['pos_value'] + data_raw['neg_value']
         else:
+            data_raw = take([('index', 'i4'), ('value', 'f4')], -1)
+            if data_raw.size != header['nasym']:
+                print('Number of found records differs from statement in header.\nContinuing with found data ...')
+            indices = data_raw['index']
+            data = data_raw['value']
+
+    else:
 
-            # ----- Read remaining header values and data for raw (symmetry-independent) file ----- #
-            header['npos'] = None
-            header['ncen'] = None
-            header['nsub'] = None
-            header['symop'] = None
-            header['subposp'] = None
-            indices = None
-
-            if header['nval'] == 2:
-                data_raw = np.fromfile(read_file, dtype=[('pos_value', 'f4'), ('neg_value', 'f4')])
-                if data_raw.size != header['nasym']:
-                    print('Number of found records differs from statement in header.\nContinuing with found data ...')
-                data = data_raw['pos_value'] + data_raw['neg_value']
-            else:
-                data = np.fromfile(read_file, dtype=np.float32)
-                if data.size != header['nasym']:
-                    print('Number of found records differs from statement in header.\nContinuing with found data ...')
+        # ----- Read remaining header values and data for raw (symmetry-independent) file ----- #
+        header['npos'] = None
+        header['ncen'] = None
+        header['nsub'] = None
+        header['symop'] = None
+        header['subposp'] = None
+        indices = None
+
+        if header['nval'] == 2:
+            data_raw = take([('pos_value', 'f4'), ('neg_value', 'f4')], -1)
+            if data_raw.size != header['nasym']:
+                print('Number of found records differs from statement in header.\nContinuing with found data ...')
+            data = data_raw['pos_value'] + data_raw['neg_value']
+        else:
+            data = take(np.float32, -1)
+            if data.size != header['nasym']:
+                print('Number of found records differs from statement in header.\nContinuing with found data ...')
 
     return header, indices, data
 
@@ -261,7 +332,7 @@ def write_grid(file, data, indices=None, *, version=None, title, gtype, ftype, n
     if (version is not None) and (version != [3, 0, 0, 0]).any():
         print('WARNING: Data assigned the unsupported format version {}.{}.{}.{} - overwriting  ... '.format(*version),
               end='')
-    version = np.array([3, 0, 0, 0])  # Version written by this routine
+    version = np.array([3, 0, 0, 0], dtype=np.int32)  # Version written by this routine
     if nval and (nval != 1):
         print(f'WARNING: Data points marked as {nval}-tuples instead of single values - correcting ... ', end='')
     nval = np.int32(1)  # OPP is a single value
@@ -277,30 +348,23 @@ def write_grid(file, data, indices=None, *, version=None, title, gtype, ftype, n
 
     with open(file, 'wb') as write_file:
 
-        # ----- Write header ----- #
-        write_file.write(version)
-        write_file.write(title.encode('utf-8').ljust(80, b'\x00'))  # Pad title field with b'\x00'
-        write_file.write(gtype)
-        write_file.write(ftype)
-        write_file.write(nval)
-        write_file.write(ndim)
-        write_file.write(ngrid)
-        write_file.write(nasym)
-        write_file.write(cell)
-
+        # ----- Assemble header and write it at once (remaining values for indexed, symmetry-dependent file) ----- #
+        header = np.array((version, title.encode('utf-8'), gtype, ftype, nval, ndim, ngrid, nasym, cell),
+                          dtype=HEADER).tobytes()  # Title is padded with b'\x00' by dtype
         if ftype == 1:
+            header += np.array((npos, ncen, nsub), dtype=HEADER_INDEXED).tobytes()
+            header += np.asarray(symop, dtype=np.int32).tobytes() + np.asarray(subposp, dtype=np.int32).tobytes()
+        write_file.write(header)
 
-            # ----- Write remaining header values and data for indexed (symmetry-dependent) file ----- #
-            write_file.write(npos)
-            write_file.write(ncen)
-            write_file.write(nsub)
-            write_file.write(symop)
-            write_file.write(subposp)
-            write_file.write(np.fromiter(zip(indices, data), dtype=[('index', indices.dtype), ('value', data.dtype)]))
-
+        # ----- Write data ----- #
+        if ftype == 1:
+            data_raw = np.empty(min(data.size, BLOCK), dtype=[('index', indices.dtype), ('value', data.dtype)])
+            for start in range(0, data.size, BLOCK):  # Assemble and write records blockwise in the same buffer
+                block = data_raw[:min(BLOCK, data.size - start)]
+                block['index'] = indices[start:start + BLOCK]
+                block['value'] = data[start:start + BLOCK]
+                write_file.write(block)
         else:
-
-            # ----- Write data for raw (symmetry-independent) file ----- #
             write_file.write(data)
 
 
@@ -330,6 +394,32 @@ def create_vesta(output_file, title, isovalue, record_type):
         file.write('  0   0   0   0\n')
 
 
+def opp_block(block, extr, temp):
+    """Calculate the OPP in place for a block of scatterer densities.
+
+    Parameters
+    ----------
+    block : numpy.ndarray[numpy.float32]
+        The scatterer densities to overwrite with the OPP (non-finite where density and extremum differ in sign or
+        density is zero).
+    extr : float
+        The extremal density.
+    temp : float
+        The absolute temperature in Kelvin.
+
+    Returns
+    -------
+    numpy.float32
+        The maximal finite OPP in the block (NaN if there is none). Non-finite OPP in the block are set to NaN.
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):  # Non-positive ratios and zero extremum yield NaN/±inf
+        np.divide(block, extr, out=block)
+        np.log(block, out=block)
+        np.multiply(block, -K_B * temp, out=block)
+    np.copyto(block, np.nan, where=np.isinf(block))  # Mark all non-finite OPP as NaN
+    return np.fmax.reduce(block)  # Maximum ignoring NaN (without warning for all-NaN blocks)
+
+
 def calc_opp(input_file, output_file, temp, source, extr=None):
     """Start main routine for calculating the OPP from scatterer density.
 
@@ -346,7 +436,14 @@ def calc_opp(input_file, output_file, temp, source, extr=None):
         user-provided value in parameter `extr`).
     extr : float, optional
         A user-provided extremal value.
+
+    Raises
+    ------
+    ValueError
+        If input and output file are the same (the input is memory-mapped while the output is written).
     """
+    if os.path.exists(output_file) and os.path.samefile(input_file, output_file):
+        raise ValueError('Input and output file are the same.')
     hello()
 
     # ----- Read in data and display information ----- #
@@ -370,11 +467,16 @@ def calc_opp(input_file, output_file, temp, source, extr=None):
 
     # ----- The real magic happens here ----- #
     print('Calculating OPP ... ', end='')
-    old_err = np.seterr(invalid='ignore')  # Suppress warnings for processing non-positive values (yields NaN/-inf)
-    output_data = -K_B * temp * np.log(input_data/extr)
-    np.seterr(**old_err)  # Restore old error settings
-    max_opp = np.nanmax(output_data)
-    output_data[np.logical_not(np.isfinite(output_data))] = max_opp  # Set NaN/-inf to highest OPP
+    output_data = input_data  # Input data not needed anymore, work in place
+    blocks = (output_data[start:start + BLOCK] for start in range(0, output_data.size, BLOCK))
+    workers = os.cpu_count() or 1
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:  # NumPy releases the GIL in its loops
+            block_maxima = list(executor.map(opp_block, blocks, repeat(extr), repeat(temp)))
+    else:
+        block_maxima = list(map(opp_block, blocks, repeat(extr), repeat(temp)))
+    max_opp = np.nanmax(block_maxima)
+    np.fmin(output_data, max_opp, out=output_data)  # Set NaN (non-finite OPP) to highest finite OPP
     print('Done.')
     print('Maximal finite OPP: {:f} eV\n'.format(max_opp))
 
@@ -402,8 +504,8 @@ if __name__ == '__main__':
         epilog='SD2OPP uses the module NumPy by the NumPy developers distributed under the BSD License 2.0 '
                '(see BSD-2.0.txt).')
 
-    parser.add_argument('input', type=ap.FileType('rb'), help='specifies the PGRID input file')
-    parser.add_argument('output', type=ap.FileType('wb'), help='specifies the PGRID output file')
+    parser.add_argument('input', type=input_path, help='specifies the PGRID input file')
+    parser.add_argument('output', type=output_path, help='specifies the PGRID output file')
     parser.add_argument('temperature', type=pos_float, help='specifies the temperature in K')
     extremum_group = parser.add_mutually_exclusive_group(required=True)
     extremum_group.add_argument('-min', '--minimum', action='store_true',
@@ -429,4 +531,7 @@ if __name__ == '__main__':
         extremum = cmd_args.extremum
 
     # ----- Call Actual Calculation ----- #
-    calc_opp(cmd_args.input.name, cmd_args.output.name, cmd_args.temperature, extr_source, extremum)
+    try:
+        calc_opp(cmd_args.input, cmd_args.output, cmd_args.temperature, extr_source, extremum)
+    except ValueError as exc:  # Same input and output file
+        parser.error(str(exc))